@@ -11,16 +11,28 @@ or falls back to defaults below.
 import torch
 from ultralytics import YOLO
 import time
-from collections import deque
 import os
 import sys
 import numpy as np
 import cv2
 from ctypes import *
 from datetime import datetime
+from collections import deque
 import threading
+import queue
 import logging
-from flask import Flask, Response, render_template_string, jsonify
+import signal
+import socket
+from flask import Flask, Response, render_template_string
+
+try:
+    import orjson
+    def dumps_json(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    import json
+    def dumps_json(obj):
+        return json.dumps(obj).encode('utf-8')
 
 # =========================
 # GPIO / RELAY CONTROL
@@ -82,7 +94,8 @@ def pulse_relay():
     print(f"  [{ts2}] \u2713 RELAY OFF")
 
 def wait_for_resume_signal():
-    """Block until Pin 33 receives a sustained HIGH signal to resume detection"""
+    """Block until Pin 33 receives a sustained HIGH signal to resume detection
+    (or until a quit is requested, e.g. SIGTERM from docker stop)"""
     set_relay_status("WAITING_RESUME")
     ts = datetime.now().strftime("%H:%M:%S.%f")[:-3]
     DEBOUNCE_COUNT = 5       # Must read HIGH this many times in a row
@@ -94,12 +107,14 @@ def wait_for_resume_signal():
         if initial == 'HIGH':
             print(f"  [{ts}] Pin {TRIGGER_PIN} already HIGH — waiting for LOW first...")
             while GPIO.input(TRIGGER_PIN) == GPIO.HIGH:
+                if quit_requested:
+                    return
                 time.sleep(TRIGGER_POLL_INTERVAL)
             ts2 = datetime.now().strftime("%H:%M:%S.%f")[:-3]
             print(f"  [{ts2}] Pin {TRIGGER_PIN} is now LOW — ready to detect resume signal")
             time.sleep(0.5)  # Settle time
 
-        while True:
+        while not quit_requested:
             pin_state = GPIO.input(TRIGGER_PIN)
             if pin_state == GPIO.HIGH:
                 # Debounce: require DEBOUNCE_COUNT consecutive HIGH reads
@@ -136,19 +151,43 @@ from CameraParams_header import *
 # =========================
 # CONFIGURATION (from env vars or defaults)
 # =========================
-MODEL_PATH = os.environ.get("MODEL_PATH", "/app/model/best.engine")
+MODEL_PATH = os.environ.get("MODEL_PATH", "/app/model/best_int8_dla0.engine")
 TARGET_CAMERA_IP = os.environ.get("CAMERA_IP", "169.254.147.1")
 
 CONF_THRESHOLD = float(os.environ.get("CONF_THRESHOLD", "0.20"))
 IOU_THRESHOLD = float(os.environ.get("IOU_THRESHOLD", "0.20"))
+MAX_DET = 50
 IMG_SIZE = int(os.environ.get("IMG_SIZE", "416"))
-
 TARGET_FPS = int(os.environ.get("TARGET_FPS", "15"))
+
+# Micro-batching: up to INFER_BATCH frames arriving within BATCH_WINDOW_MS go
+# through one inference call (engine must be exported with EXPORT_BATCH >= this).
+# The window defaults to half a frame period at TARGET_FPS, so a slow camera
+# never holds a batch back by more than that.
+INFER_BATCH = max(1, int(os.environ.get("INFER_BATCH", "1")))
+BATCH_WINDOW_MS = int(os.environ.get("BATCH_WINDOW_MS") or 500 // max(1, TARGET_FPS))
+# Extra engines (comma-separated, e.g. the DLA1 and GPU builds) that infer successive
+# batches in parallel with MODEL_PATH, one worker thread per engine
+EXTRA_ENGINES = [p.strip() for p in os.environ.get("EXTRA_ENGINES", "").split(",") if p.strip()]
+
 DISPLAY_INTERVAL = 0.033  # ~30 FPS display update
 
+# Static-frame gate: skip YOLO when the 8x8x3 downsampled frame differs from the
+# last inferred frame by less than this sum of absolute pixel differences (0 = off)
+STATIC_DIFF_THRESHOLD = int(os.environ.get("STATIC_DIFF_THRESHOLD", "0"))
+
+# Pin pipeline threads to fixed cores (Orin Nano: 6 cores): capture on 0-1, the
+# main post-processing loop on 2-3, inference workers (TensorRT/CUDA host work) on 4-5
+PIN_THREADS = os.environ.get("PIN_THREADS", "true").lower() in ("true", "1", "yes")
+CAPTURE_CPUS = {0, 1}
+POST_CPUS = {2, 3}
+INFER_CPUS = {4, 5}
+
 # Camera Settings
 EXPOSURE_TIME = float(os.environ.get("EXPOSURE_TIME", "410.0"))
 GAIN = float(os.environ.get("GAIN", "20.0"))
+# SDK frame buffer depth — keep small so a slow consumer never sees stale frames
+CAMERA_BUFFERS = int(os.environ.get("CAMERA_BUFFERS", "2"))
 
 # Headless mode (no display window)
 HEADLESS = os.environ.get("HEADLESS", "false").lower() in ("true", "1", "yes")
@@ -156,10 +195,29 @@ HEADLESS = os.environ.get("HEADLESS", "false").lower() in ("true", "1", "yes")
 # Web streaming
 WEB_PORT = int(os.environ.get("WEB_PORT", "3000"))
 ENABLE_WEB = os.environ.get("ENABLE_WEB", "true").lower() in ("true", "1", "yes")
+# Web frames are downscaled to at most this width before JPEG encoding (0 = full resolution)
+WEB_MAX_WIDTH = int(os.environ.get("WEB_MAX_WIDTH", "1280"))
+# Max frame rate sent to the browser (0 = every processed frame); frames in between
+# are neither copied into the web buffer nor encoded
+WEB_FPS = float(os.environ.get("WEB_FPS", "10"))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", "8"))  # waitress worker threads (one per open MJPEG stream)
 
 # Shared frame and stats for web streaming
-latest_frame = None
-frame_lock = threading.Lock()
+# Triple-buffered web frame: the main loop copies into the write slot outside any
+# lock, then publishes its index. The encoder pins the slot it is reading, and the
+# next write slot is never the ready or the pinned one, so a slot is never
+# overwritten mid-encode.
+web_frames = [None, None, None]
+web_write_idx = 0
+web_ready_idx = -1  # -1 = no frame published yet
+web_pinned_idx = -1  # Slot the encoder is reading (-1 = none)
+web_frame_version = 0  # Incremented on every publish
+# Notified on every publish (and client connect) so the encoder thread wakes once per new frame
+frame_cond = threading.Condition()
+# Latest JPEG from the encoder thread, shared by all MJPEG clients: (frame version, bytes)
+encoded_frame = (-1, None)
+jpeg_cond = threading.Condition()  # Notified whenever encoded_frame changes
+mjpeg_clients = 0  # Open /video_feed streams; the encoder idles while there are none
 live_stats = {
     "fps": 0.0,
     "frame_count": 0,
@@ -174,11 +232,80 @@ live_stats = {
     "relay_pin": RELAY_PIN,
     "trigger_pin": TRIGGER_PIN
 }
+# live_stats is only written by the main loop, which serializes it after each
+# update; stats_lock just guards the swap of the pre-serialized bytes
+stats_json_bytes = dumps_json(live_stats)
 stats_lock = threading.Lock()
 
+def publish_stats():
+    """Serialize live_stats on the producer side and swap it in for /api/stats"""
+    global stats_json_bytes
+    new_bytes = dumps_json(live_stats)
+    with stats_lock:
+        stats_json_bytes = new_bytes
+
 # Results folder
 RESULTS_FOLDER = "/app/results"
 os.makedirs(RESULTS_FOLDER, exist_ok=True)
+# Joined once; defect frame paths are then a single f-string
+RESULTS_PREFIX = os.path.join(RESULTS_FOLDER, "defect_")
+LOG_PREFIX = os.path.join(RESULTS_FOLDER, "defect_log_")
+
+# =========================
+# DEFECT FRAME WRITER
+# =========================
+# JPEG encode + SD-card write of defect frames runs on background threads so
+# disk I/O never stalls the capture → inference loop. cv2.imwrite releases the
+# GIL, so two writers keep up when defects come in bursts.
+SAVE_JPEG_QUALITY = 85
+SAVE_THREADS = 2
+save_q = queue.Queue(maxsize=32)
+save_buf_pool = deque()  # Recycled frame copies (reused instead of a fresh allocation per save)
+
+def _recycle_save_buf(img):
+    if len(save_buf_pool) < save_q.maxsize + SAVE_THREADS:
+        save_buf_pool.append(img)
+
+def save_worker():
+    """Drain save_q and write each (path, image) to disk"""
+    while True:
+        path, img = save_q.get()
+        try:
+            if not cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, SAVE_JPEG_QUALITY]):
+                print(f"  WARNING: Failed to save {path}")
+        except Exception as e:
+            # A bad frame or full disk must not kill the writer (cleanup joins save_q)
+            print(f"  WARNING: Failed to save {path}: {e}")
+        finally:
+            _recycle_save_buf(img)
+            save_q.task_done()
+
+def queue_frame_save(path, img):
+    """Queue a copy of img for saving; drops the oldest pending frame if the queue is full"""
+    try:
+        buf = save_buf_pool.popleft()
+    except IndexError:
+        buf = None
+    if buf is None or buf.shape != img.shape:
+        buf = np.empty_like(img)
+    np.copyto(buf, img)
+    item = (path, buf)
+    while True:
+        try:
+            save_q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                dropped_path, dropped_img = save_q.get_nowait()
+                _recycle_save_buf(dropped_img)
+                save_q.task_done()
+                print(f"  WARNING: Save queue full — dropped {dropped_path}")
+            except queue.Empty:
+                pass
+
+save_threads = [threading.Thread(target=save_worker, daemon=True) for _ in range(SAVE_THREADS)]
+for t in save_threads:
+    t.start()
 
 # Auto-detect display availability
 HAS_DISPLAY = False
@@ -202,7 +329,11 @@ print(f"  Camera IP:     {TARGET_CAMERA_IP}")
 print(f"  Confidence:    {CONF_THRESHOLD}")
 print(f"  IOU:           {IOU_THRESHOLD}")
 print(f"  Image Size:    {IMG_SIZE}")
+print(f"  Infer Batch:   {INFER_BATCH}" + (f" (window {BATCH_WINDOW_MS} ms)" if INFER_BATCH > 1 else ""))
+if EXTRA_ENGINES:
+    print(f"  Extra Engines: {', '.join(EXTRA_ENGINES)}")
 print(f"  Target FPS:    {TARGET_FPS}")
+print(f"  Static Gate:   {STATIC_DIFF_THRESHOLD if STATIC_DIFF_THRESHOLD > 0 else 'OFF'}")
 print(f"  Exposure:      {EXPOSURE_TIME} µs")
 print(f"  Gain:          {GAIN}")
 print(f"  Display:       {'ON' if HAS_DISPLAY else 'HEADLESS'}")
@@ -218,6 +349,34 @@ print("=" * 70)
 # =========================
 web_app = Flask(__name__)
 
+# GPU JPEG encoder (CUDA nvJPEG, runs on the SMs — not the NVJPG block) for the MJPEG stream.
+# Falls back to CPU libjpeg (cv2.imencode) when PyNvJpeg is not installed.
+WEB_JPEG_QUALITY = int(os.environ.get("WEB_JPEG_QUALITY", "70"))
+# Baseline (non-progressive), no Huffman optimization pass — cheapest libjpeg path
+WEB_JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, WEB_JPEG_QUALITY,
+                   cv2.IMWRITE_JPEG_OPTIMIZE, 0, cv2.IMWRITE_JPEG_PROGRESSIVE, 0]
+nvjpeg_encoder = None
+if ENABLE_WEB:
+    try:
+        from nvjpeg import NvJpeg
+        nvjpeg_encoder = NvJpeg()
+        print("\u2713 nvJPEG GPU encoder initialized for web stream")
+    except ImportError:
+        print("WARNING: nvjpeg not available — web stream uses CPU JPEG encoding")
+        print("  Install with: pip3 install pynvjpeg")
+    except Exception as e:
+        print(f"WARNING: nvJPEG init failed: {e} — web stream uses CPU JPEG encoding")
+        nvjpeg_encoder = None
+
+def encode_jpeg(img):
+    """Encode a BGR frame to JPEG bytes (nvJPEG if available, else OpenCV). Returns None on failure."""
+    if nvjpeg_encoder is not None:
+        return nvjpeg_encoder.encode(img, WEB_JPEG_QUALITY)
+    ret, jpeg = cv2.imencode('.jpg', img, WEB_JPEG_PARAMS)
+    if not ret:
+        return None
+    return jpeg.tobytes()
+
 # Suppress noisy Flask /api/stats request logs
 class StatsFilter(logging.Filter):
     def filter(self, record):
@@ -399,24 +558,80 @@ WEB_PAGE = """
 </html>
 """
 
-def generate_mjpeg():
-    """Generator for MJPEG stream"""
+def publish_web_frame(img):
+    """Copy (downscaled) annotated frame into the next web slot and mark it ready (main loop only)"""
+    global web_write_idx, web_ready_idx, web_frame_version
+    h, w = img.shape[:2]
+    if WEB_MAX_WIDTH and w > WEB_MAX_WIDTH:
+        out_shape = (h * WEB_MAX_WIDTH // w, WEB_MAX_WIDTH) + img.shape[2:]
+    else:
+        out_shape = img.shape
+    slot = web_frames[web_write_idx]
+    if slot is None or slot.shape != out_shape:
+        slot = np.empty(out_shape, dtype=img.dtype)
+        web_frames[web_write_idx] = slot
+    if out_shape == img.shape:
+        np.copyto(slot, img)
+    else:
+        # Resize straight into the slot — clients encode the small frame only
+        cv2.resize(img, (out_shape[1], out_shape[0]), dst=slot, interpolation=cv2.INTER_AREA)
+    with frame_cond:
+        web_ready_idx = web_write_idx
+        next_idx = (web_write_idx + 1) % len(web_frames)
+        if next_idx == web_pinned_idx:
+            next_idx = (next_idx + 1) % len(web_frames)
+        web_write_idx = next_idx
+        web_frame_version += 1
+        frame_cond.notify_all()
+
+def jpeg_encoder_worker():
+    """Encode each newly published web frame once and hand the bytes to every MJPEG client"""
+    global encoded_frame, web_pinned_idx
+    encoded_version = -1
     while True:
-        with frame_lock:
-            if latest_frame is None:
-                time.sleep(0.05)
-                continue
-            ret, jpeg = cv2.imencode('.jpg', latest_frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-            if not ret:
+        with frame_cond:
+            frame_cond.wait_for(lambda: web_frame_version != encoded_version and mjpeg_clients > 0)
+            encoded_version = web_frame_version
+            ready_idx = web_pinned_idx = web_ready_idx
+        if ready_idx < 0:
+            continue
+        frame_bytes = encode_jpeg(web_frames[ready_idx])
+        web_pinned_idx = -1
+        if frame_bytes is None:
+            continue
+        with jpeg_cond:
+            encoded_frame = (encoded_version, frame_bytes)
+            jpeg_cond.notify_all()
+
+def generate_mjpeg():
+    """Generator for MJPEG stream — yields each JPEG produced by the encoder thread"""
+    global mjpeg_clients
+    with frame_cond:
+        mjpeg_clients += 1
+        frame_cond.notify_all()
+    try:
+        sent_version = -1
+        while True:
+            with jpeg_cond:
+                # Wake on the next encoded frame; on timeout re-send the last one as a keep-alive
+                jpeg_cond.wait_for(lambda: encoded_frame[0] != sent_version, timeout=1.0)
+                sent_version, frame_bytes = encoded_frame
+            if frame_bytes is None:
                 continue
-            frame_bytes = jpeg.tobytes()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        time.sleep(0.033)  # ~30 FPS max
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+    finally:
+        # Client disconnected (generator closed by the server)
+        with frame_cond:
+            mjpeg_clients -= 1
+
+# WEB_PAGE has no template variables — render it once instead of on every GET
+with web_app.app_context():
+    RENDERED_INDEX = render_template_string(WEB_PAGE).encode('utf-8')
 
 @web_app.route('/')
 def index():
-    return render_template_string(WEB_PAGE)
+    return Response(RENDERED_INDEX, mimetype='text/html')
 
 @web_app.route('/video_feed')
 def video_feed():
@@ -425,13 +640,23 @@ def video_feed():
 @web_app.route('/api/stats')
 def api_stats():
     with stats_lock:
-        return jsonify(live_stats)
+        body = stats_json_bytes
+    return Response(body, mimetype='application/json')
 
 def start_web_server():
-    """Start Flask in a background thread"""
-    web_app.run(host='0.0.0.0', port=WEB_PORT, threaded=True, use_reloader=False)
+    """Start the web server in a background thread (waitress if installed, else Flask dev server)"""
+    try:
+        from waitress import serve
+    except ImportError:
+        print("WARNING: waitress not available — using Flask development server")
+        print("  Install with: pip3 install waitress")
+        web_app.run(host='0.0.0.0', port=WEB_PORT, threaded=True, use_reloader=False)
+        return
+    serve(web_app, host='0.0.0.0', port=WEB_PORT, threads=WEB_THREADS, _quiet=True)
 
 if ENABLE_WEB:
+    encoder_thread = threading.Thread(target=jpeg_encoder_worker, daemon=True)
+    encoder_thread.start()
     web_thread = threading.Thread(target=start_web_server, daemon=True)
     web_thread.start()
     print(f"\n>>> Web stream available at: http://<jetson-ip>:{WEB_PORT}")
@@ -442,16 +667,26 @@ if ENABLE_WEB:
 # =========================
 def to_hex_str(num):
     """Convert error code to hex string"""
-    chaDic = {10: 'a', 11: 'b', 12: 'c', 13: 'd', 14: 'e', 15: 'f'}
-    hexStr = ""
-    if num < 0:
-        num = num + 2 ** 32
-    while num >= 16:
-        digit = num % 16
-        hexStr = chaDic.get(digit, str(digit)) + hexStr
-        num //= 16
-    hexStr = chaDic.get(num, str(num)) + hexStr
-    return hexStr
+    return format(num & 0xFFFFFFFF, 'x')
+
+AVAILABLE_CPUS = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else set()
+
+def pin_current_thread(cpus, nice=0):
+    """Restrict the calling thread to cpus (Linux per-thread affinity) and optionally renice it"""
+    if not PIN_THREADS:
+        return
+    cpus = cpus & AVAILABLE_CPUS  # Ignore cores the container doesn't have
+    try:
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+        if nice:
+            os.nice(nice)  # Per-thread on Linux
+    except OSError as e:
+        print(f"WARNING: Thread pinning failed: {e}")
+
+def decode_ipv4(n):
+    """Dotted-quad string for an SDK nCurrentIp (host-order uint32)"""
+    return socket.inet_ntoa((n & 0xFFFFFFFF).to_bytes(4, "big"))
 
 # =========================
 # MODEL INITIALIZATION
@@ -466,30 +701,230 @@ if device == "cpu":
 # Determine if model is TensorRT engine
 is_engine = MODEL_PATH.endswith(".engine")
 
-# Fallback: if .engine not found, try .pt
+# Fallback: if the model is not found, try the other engine builds, then .pt
 if not os.path.exists(MODEL_PATH):
-    alt_path = MODEL_PATH.replace(".engine", ".pt")
-    if os.path.exists(alt_path):
-        print(f"TensorRT engine not found. Falling back to PyTorch model: {alt_path}")
+    model_dir = os.path.dirname(MODEL_PATH)
+    candidates = [os.path.join(model_dir, name) for name in
+                  ("best_int8_dla0.engine", "best_int8.engine", "best.engine")]
+    candidates += [MODEL_PATH.replace(".engine", ".pt"), os.path.join(model_dir, "best.pt")]
+    alt_path = next((p for p in candidates if os.path.exists(p)), None)
+    if alt_path:
+        print(f"Model not found at {MODEL_PATH}. Falling back to: {alt_path}")
         MODEL_PATH = alt_path
-        is_engine = False
+        is_engine = MODEL_PATH.endswith(".engine")
     else:
-        print(f"ERROR: Model not found at {MODEL_PATH} or {alt_path}")
+        print(f"ERROR: Model not found at {MODEL_PATH} (also tried {', '.join(candidates)})")
         print("Please place your model in the ./model/ directory")
         exit(1)
 
-print(f"Loading model: {MODEL_PATH} ({'TensorRT' if is_engine else 'PyTorch'})")
+# Engine precision from the export naming (best_int8*.engine = INT8 build, else FP16)
+if is_engine:
+    model_precision = "INT8" if "_int8" in os.path.basename(MODEL_PATH) else "FP16"
+    if "_dla" in os.path.basename(MODEL_PATH):
+        model_precision += " + DLA"
+else:
+    # .pt: predict() and the direct path both run it with half=True on CUDA
+    model_precision = "FP16" if device == "cuda" else "FP32"
+print(f"Loading model: {MODEL_PATH} ({'TensorRT' if is_engine else 'PyTorch'}, {model_precision})")
 model = YOLO(MODEL_PATH)
 
 if not is_engine:
     model.to(device)
 
+# Class id → name as a plain list, indexed straight from the int32 class array
+CLASS_NAMES = [model.names.get(i, str(i)) for i in range(max(model.names, default=-1) + 1)]
+
+# =========================
+# GPU PREPROCESSING
+# =========================
+# Letterbox + BGR→RGB + HWC→CHW + /255 done on the GPU in one pass over the
+# uploaded frame, instead of Ultralytics' CPU letterbox followed by an H2D copy
+# of the resized image. Boxes come back in letterbox coordinates and are mapped
+# to frame pixels with unletterbox_boxes().
+GPU_PREPROCESS = (os.environ.get("GPU_PREPROCESS", "true").lower() in ("true", "1", "yes")
+                  and device == "cuda")
+LETTERBOX_FILL = 114 / 255.0  # Same grey padding as Ultralytics letterbox
+
+class InferenceContext:
+    """Device-side state of one engine; each context is driven by a single inference worker"""
+    def __init__(self, backend=None):
+        self.backend = backend            # Ultralytics AutoBackend (model.predictor.model), set after warm-up
+        self.gpu_input = None             # Persistent (INFER_BATCH, 3, IMG_SIZE, IMG_SIZE) device tensor
+        self.gpu_input_src_shape = None   # Frame shape gpu_input padding was laid out for
+        # Camera frame upload: page-locked staging buffer + dedicated copy stream so the
+        # H2D transfer is a real async DMA instead of a pageable (bounce-buffered) copy
+        self.pinned_frame = None          # Page-locked host copy of the BGR frame
+        self.gpu_frame = None             # Device copy of the BGR frame (uint8 HWC)
+        self.copy_stream = torch.cuda.Stream() if GPU_PREPROCESS else None
+        self.copy_done = torch.cuda.Event() if GPU_PREPROCESS else None
+
+# Captured frames are color-converted straight into pooled (page-locked) BGR
+# buffers so they upload without the staging copy. Buffers are owned by one frame
+# at a time: taken by grab_frame() and handed back with release_frame_buffer()
+# once the main loop is done with that frame.
+FRAME_POOL_MIN = max(2, INFER_BATCH)  # Double-buffered at least
+frame_pool = deque()          # Free BGR buffers
+frame_pool_shape = None
+pool_buffers = {}             # ndarray data pointer → backing storage (pinned tensor, or the ndarray itself)
+
+def _new_frame_buffer(shape):
+    if GPU_PREPROCESS:
+        pinned = torch.empty(shape, dtype=torch.uint8).pin_memory()
+        buf = pinned.numpy()
+        pool_buffers[buf.ctypes.data] = pinned
+        return buf
+    buf = np.empty(shape, dtype=np.uint8)
+    pool_buffers[buf.ctypes.data] = buf
+    return buf
+
+def next_frame_buffer(shape):
+    """Take a free BGR buffer from the frame pool (grows if every buffer is in use)"""
+    global frame_pool_shape
+    if frame_pool_shape != shape:
+        frame_pool.clear()
+        pool_buffers.clear()
+        frame_pool.extend(_new_frame_buffer(shape) for _ in range(FRAME_POOL_MIN))
+        frame_pool_shape = shape
+    if not frame_pool:
+        return _new_frame_buffer(shape)
+    return frame_pool.popleft()
+
+def release_frame_buffer(buf):
+    """Return a frame buffer to the pool once nothing reads it any more"""
+    if buf.shape == frame_pool_shape and buf.ctypes.data in pool_buffers:
+        frame_pool.append(buf)
+
+def upload_frame(frame, ctx):
+    """Copy a BGR frame to the GPU on ctx.copy_stream (via the pinned staging buffer if it is pageable)"""
+    if ctx.gpu_frame is None or tuple(ctx.gpu_frame.shape) != frame.shape:
+        ctx.gpu_frame = torch.empty(frame.shape, dtype=torch.uint8, device=device)
+    src = pool_buffers.get(frame.ctypes.data) if GPU_PREPROCESS else None
+    if src is None:
+        if ctx.pinned_frame is None or tuple(ctx.pinned_frame.shape) != frame.shape:
+            ctx.pinned_frame = torch.empty(frame.shape, dtype=torch.uint8).pin_memory()
+        ctx.copy_done.synchronize()  # Previous DMA out of pinned_frame has finished
+        np.copyto(ctx.pinned_frame.numpy(), frame)
+        src = ctx.pinned_frame
+    ctx.copy_stream.wait_stream(torch.cuda.current_stream())  # Previous frame's kernels are done with gpu_frame
+    with torch.cuda.stream(ctx.copy_stream):
+        ctx.gpu_frame.copy_(src, non_blocking=True)
+        ctx.copy_done.record(ctx.copy_stream)
+    torch.cuda.current_stream().wait_event(ctx.copy_done)
+    return ctx.gpu_frame
+
+def preprocess_gpu(frames, ctx):
+    """Letterbox a list of same-sized BGR uint8 frames into the context's persistent GPU input tensor.
+    Returns (batch tensor, (scale, pad_x, pad_y))."""
+    h, w = frames[0].shape[:2]
+    scale = min(IMG_SIZE / h, IMG_SIZE / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    pad_x, pad_y = (IMG_SIZE - new_w) // 2, (IMG_SIZE - new_h) // 2
+
+    if ctx.gpu_input is None or ctx.gpu_input_src_shape != frames[0].shape:
+        ctx.gpu_input = torch.full((INFER_BATCH, 3, IMG_SIZE, IMG_SIZE), LETTERBOX_FILL,
+                                   dtype=torch.float16, device=device)
+        ctx.gpu_input_src_shape = frames[0].shape
+
+    for i, frame in enumerate(frames):
+        img = upload_frame(frame, ctx)
+        img = img.permute(2, 0, 1)[[2, 1, 0]].unsqueeze(0).half().div_(255)  # BGR HWC → RGB CHW
+        img = torch.nn.functional.interpolate(img, size=(new_h, new_w), mode="bilinear", align_corners=False)
+        ctx.gpu_input[i:i + 1, :, pad_y:pad_y + new_h, pad_x:pad_x + new_w] = img
+    return ctx.gpu_input[:len(frames)], (scale, pad_x, pad_y)
+
+def unletterbox_boxes(dets, letterbox, frame_shape):
+    """Map (N, 6) detections from letterbox coordinates back to frame pixels (in place)"""
+    scale, pad_x, pad_y = letterbox
+    dets[:, [0, 2]] -= pad_x
+    dets[:, [1, 3]] -= pad_y
+    dets[:, :4] /= scale
+    dets[:, [0, 2]] = dets[:, [0, 2]].clip(0, frame_shape[1])
+    dets[:, [1, 3]] = dets[:, [1, 3]].clip(0, frame_shape[0])
+
+# Direct inference: call the loaded engine (Ultralytics AutoBackend) on the
+# preprocessed GPU tensor and run NMS ourselves, skipping BasePredictor's
+# per-call setup, source handling and Results construction
+DIRECT_INFERENCE = (os.environ.get("DIRECT_INFERENCE", "true").lower() in ("true", "1", "yes")
+                    and GPU_PREPROCESS)
+contexts = [InferenceContext()]  # MODEL_PATH first, then any EXTRA_ENGINES
+
+try:
+    from ultralytics.utils.nms import non_max_suppression
+except ImportError:
+    from ultralytics.utils.ops import non_max_suppression
+
+def run_backend(model_input, ctx):
+    """Run the context's engine on a preprocessed (B, 3, IMG_SIZE, IMG_SIZE) tensor.
+    Returns a list of (N, 6) detection tensors in letterbox coordinates."""
+    backend = ctx.backend
+    with torch.inference_mode():
+        preds = backend(model_input if backend.fp16 else model_input.float())
+    if isinstance(preds, (list, tuple)):
+        preds = preds[0]
+    if preds.shape[-1] == 6 and preds.shape[1] > 6:
+        # Engine exported with embedded NMS: (B, max_det, 6). export_tensorrt.py bakes in
+        # CONF/IOU_THRESHOLD and agnostic NMS, so re-exporting is needed after changing them
+        return [p[p[:, 4] > CONF_THRESHOLD][:MAX_DET] for p in preds]
+    return non_max_suppression(preds, CONF_THRESHOLD, IOU_THRESHOLD,
+                               agnostic=True, max_det=MAX_DET)
+
+def infer_batch(frames, predict_kwargs, ctx):
+    """Run YOLO on a list of BGR frames in one call.
+    Returns one (N, 6) array of (x1, y1, x2, y2, conf, cls) in frame pixels per frame."""
+    if GPU_PREPROCESS:
+        model_input, letterbox = preprocess_gpu(frames, ctx)
+    else:
+        model_input = frames if len(frames) > 1 else frames[0]
+
+    if DIRECT_INFERENCE:
+        batch_tensors = run_backend(model_input, ctx)
+    else:
+        batch_tensors = [result.boxes.data for result in model.predict(model_input, **predict_kwargs)]
+
+    # Single device→host transfer for all boxes of the whole batch, split per frame
+    counts = [len(t) for t in batch_tensors]
+    all_dets = torch.cat([t.float() for t in batch_tensors]).cpu().numpy()
+    batch_dets = np.split(all_dets, np.cumsum(counts)[:-1])
+    if GPU_PREPROCESS:
+        for frame, dets in zip(frames, batch_dets):
+            unletterbox_boxes(dets, letterbox, frame.shape)
+    return batch_dets
+
+print(f"Preprocessing: {'GPU (letterbox on device)' if GPU_PREPROCESS else 'CPU (Ultralytics)'}")
+print(f"Inference:     {'direct engine call + NMS' if DIRECT_INFERENCE else 'Ultralytics predict()'}")
+
+def warm_up_engine(yolo_model, half=False):
+    """Build the predictor and run the engine at the exact runtime shape; returns its AutoBackend.
+    half=True builds a .pt model's backend in FP16, as predict(half=True) would run it."""
+    # One predict() builds the predictor, then run the engine directly and wait for
+    # TensorRT tactic selection / workspace allocation to finish before frame 1
+    dummy_cuda = torch.zeros((INFER_BATCH, 3, IMG_SIZE, IMG_SIZE), dtype=torch.float16, device=device)
+    _ = yolo_model.predict(dummy_cuda, verbose=False, imgsz=IMG_SIZE, half=half)
+    engine_backend = yolo_model.predictor.model
+    dummy_cuda = dummy_cuda if engine_backend.fp16 else dummy_cuda.float()
+    for _ in range(10):
+        _ = yolo_model.predictor.inference(dummy_cuda)
+    torch.cuda.synchronize()
+    return engine_backend
+
 # Warm up
 print("Warming up model...")
-dummy = np.zeros((IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8)
-for _ in range(5):
-    _ = model.predict(dummy, verbose=False, imgsz=IMG_SIZE)
-print("Model warmed up!\n")
+if device == "cuda":
+    contexts[0].backend = warm_up_engine(model, half=not is_engine)
+    if EXTRA_ENGINES and not DIRECT_INFERENCE:
+        print("WARNING: EXTRA_ENGINES needs GPU_PREPROCESS and DIRECT_INFERENCE — using MODEL_PATH only")
+    elif EXTRA_ENGINES:
+        for engine_path in EXTRA_ENGINES:
+            if not os.path.exists(engine_path):
+                print(f"WARNING: Extra engine not found, skipping: {engine_path}")
+                continue
+            print(f"Loading extra engine: {engine_path}")
+            contexts.append(InferenceContext(warm_up_engine(YOLO(engine_path))))
+else:
+    dummy = np.zeros((IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8)
+    for _ in range(5):
+        _ = model.predict(dummy, verbose=False, imgsz=IMG_SIZE)
+print(f"Model warmed up! ({len(contexts)} inference worker{'s' if len(contexts) > 1 else ''})\n")
 
 # =========================
 # CAMERA INITIALIZATION
@@ -525,11 +960,7 @@ for i in range(deviceList.nDeviceNum):
     mvcc_dev_info = cast(deviceList.pDeviceInfo[i], POINTER(MV_CC_DEVICE_INFO)).contents
     
     if mvcc_dev_info.nTLayerType == MV_GIGE_DEVICE:
-        nip1 = ((mvcc_dev_info.SpecialInfo.stGigEInfo.nCurrentIp & 0xff000000) >> 24)
-        nip2 = ((mvcc_dev_info.SpecialInfo.stGigEInfo.nCurrentIp & 0x00ff0000) >> 16)
-        nip3 = ((mvcc_dev_info.SpecialInfo.stGigEInfo.nCurrentIp & 0x0000ff00) >> 8)
-        nip4 = (mvcc_dev_info.SpecialInfo.stGigEInfo.nCurrentIp & 0x000000ff)
-        camera_ip = f"{nip1}.{nip2}.{nip3}.{nip4}"
+        camera_ip = decode_ipv4(mvcc_dev_info.SpecialInfo.stGigEInfo.nCurrentIp)
         
         print(f"  [{i}] GigE Camera at IP: {camera_ip}")
         
@@ -562,6 +993,17 @@ if ret != 0:
 
 print("✓ Camera opened successfully!")
 
+# Bound the SDK buffer queue (default is multi-frame) so frames can't pile up
+# while inference is busy, and always hand out the newest frame
+ret = cam.MV_CC_SetImageNodeNum(CAMERA_BUFFERS)
+if ret != 0:
+    print(f"  Warning: Set image node num failed! ret = 0x{to_hex_str(ret)}")
+else:
+    print(f"✓ Camera buffer depth set to {CAMERA_BUFFERS} frames")
+ret = cam.MV_CC_SetGrabStrategy(MV_GrabStrategy_LatestImagesOnly)
+if ret != 0:
+    print(f"  Warning: Set grab strategy failed! ret = 0x{to_hex_str(ret)}")
+
 # Set optimal packet size for GigE camera
 nPacketSize = cam.MV_CC_GetOptimalPacketSize()
 if int(nPacketSize) > 0:
@@ -616,17 +1058,331 @@ print("-" * 70)
 # =========================
 # LOGGING AND STATS
 # =========================
-defect_log = []
-fps_queue = deque(maxlen=30)
+# Columnar defect log: one preallocated array per field, grown by doubling,
+# instead of a dict per detection. defect_total is the number of rows in use.
+DEFECT_LOG_CHUNK = 65536
+defect_log = {
+    "time": np.empty(DEFECT_LOG_CHUNK, dtype=np.float64),      # Epoch seconds
+    "frame": np.empty(DEFECT_LOG_CHUNK, dtype=np.int64),
+    "class": np.empty(DEFECT_LOG_CHUNK, dtype=np.int16),
+    "confidence": np.empty(DEFECT_LOG_CHUNK, dtype=np.float32),
+    "bbox": np.empty((DEFECT_LOG_CHUNK, 4), dtype=np.int32),  # x1, y1, x2, y2
+}
+defect_total = 0
+
+def log_defects(t, frame_no, boxes, confs, classes):
+    """Append one frame's detections to the columnar defect log"""
+    global defect_total
+    start, end = defect_total, defect_total + len(boxes)
+    capacity = len(defect_log["frame"])
+    if end > capacity:
+        while capacity < end:
+            capacity *= 2
+        for key, col in defect_log.items():
+            grown = np.empty((capacity,) + col.shape[1:], dtype=col.dtype)
+            grown[:start] = col[:start]
+            defect_log[key] = grown
+    defect_log["time"][start:end] = t
+    defect_log["frame"][start:end] = frame_no
+    defect_log["class"][start:end] = classes
+    defect_log["confidence"][start:end] = confs
+    defect_log["bbox"][start:end] = boxes
+    defect_total = end
+
+avg_fps = 0.0             # Exponential moving average of per-frame FPS
+FPS_EMA_ALPHA = 0.1
+STATS_EVERY_N_FRAMES = 15 # Re-serialize web stats this often (and on any state change)
 frame_count = 0
 defect_frame_count = 0
-start_time = time.time()
+start_time = time.monotonic()  # Runtime clock (monotonic: immune to NTP/RTC jumps on the Jetson)
 last_display_time = 0
+last_web_publish_time = 0
+STATS_OVERLAY_INTERVAL = 1.0  # Seconds between re-renders of the stats overlay text
+stats_overlay = []        # Cached [(row, col, patch)] of the rendered stats lines
+last_overlay_time = 0
+overlay_defects = -1      # defect_count the cached overlay was rendered for
+prev_digest = None        # 8x8x3 digest of the last frame that went through YOLO
+last_defect_count = 0
+skipped_frames = 0
+NO_DETECTIONS = np.zeros((0, 6), dtype=np.float32)
 
 # Buffer for image data
 stOutFrame = MV_FRAME_OUT()
 memset(byref(stOutFrame), 0, sizeof(stOutFrame))
 
+# Bayer demosaic on the GPU when OpenCV is built with CUDA: only the 1-byte/pixel
+# raw frame is uploaded and the ARM cores skip the full-frame demosaic.
+# The stock pip OpenCV is CPU-only, in which case cv2.cvtColor is used.
+CUDA_DEMOSAIC = False
+try:
+    CUDA_DEMOSAIC = cv2.cuda.getCudaEnabledDeviceCount() > 0
+except (AttributeError, cv2.error):
+    pass
+gpu_raw = cv2.cuda_GpuMat() if CUDA_DEMOSAIC else None
+gpu_bgr = cv2.cuda_GpuMat() if CUDA_DEMOSAIC else None
+print(f"Demosaic:      {'GPU (cv2.cuda)' if CUDA_DEMOSAIC else 'CPU (cv2.cvtColor)'}")
+
+# Per-format decoders: each reshapes the raw SDK bytes and converts them to BGR
+# straight into out (a page-locked pool buffer) in a single C call
+def _decode_mono8(src, h, w, out):
+    return cv2.cvtColor(src.reshape((h, w)), cv2.COLOR_GRAY2BGR, dst=out)
+
+def _decode_rgb8(src, h, w, out):
+    return cv2.cvtColor(src.reshape((h, w, 3)), cv2.COLOR_RGB2BGR, dst=out)
+
+def _decode_bayer_gpu(src, h, w, out):
+    gpu_raw.upload(src.reshape((h, w)))
+    cv2.cuda.demosaicing(gpu_raw, cv2.COLOR_BayerBG2BGR, dst=gpu_bgr)
+    return gpu_bgr.download(dst=out)
+
+def _decode_bayer_cpu(src, h, w, out):
+    return cv2.cvtColor(src.reshape((h, w)), cv2.COLOR_BayerBG2BGR, dst=out)
+
+# enPixelType → decoder, resolved once at startup (incl. the GPU/CPU demosaic choice).
+# All Bayer layouts use the BG code, as this camera has always been converted.
+_decode_bayer = _decode_bayer_gpu if CUDA_DEMOSAIC else _decode_bayer_cpu
+DECODE = {
+    PixelType_Gvsp_Mono8: _decode_mono8,
+    PixelType_Gvsp_RGB8_Packed: _decode_rgb8,
+    PixelType_Gvsp_BayerGR8: _decode_bayer,
+    PixelType_Gvsp_BayerRG8: _decode_bayer,
+    PixelType_Gvsp_BayerGB8: _decode_bayer,
+    PixelType_Gvsp_BayerBG8: _decode_bayer,
+}
+
+def grab_frame(timeout_ms):
+    """Get the next camera frame as a BGR ndarray, or None if none arrived within timeout_ms"""
+    ret = cam.MV_CC_GetImageBuffer(stOutFrame, timeout_ms)
+    if ret != 0:
+        return None
+
+    # Convert straight out of the SDK buffer (zero-copy view, no intermediate
+    # memcpy) and hand it back as soon as the single conversion pass has read it
+    frame_info = stOutFrame.stFrameInfo
+    try:
+        src = np.ctypeslib.as_array(cast(stOutFrame.pBufAddr, POINTER(c_ubyte)),
+                                    shape=(frame_info.nFrameLen,))
+        return convert_frame(src, frame_info)
+    finally:
+        cam.MV_CC_FreeImageBuffer(stOutFrame)
+
+def convert_frame(frame, frame_info):
+    """Convert a raw SDK frame into a BGR frame that owns its memory"""
+    # Color conversion writes straight into a (page-locked) pool buffer that
+    # upload_frame() can DMA without staging
+    h, w = frame_info.nHeight, frame_info.nWidth
+    decode = DECODE.get(frame_info.enPixelType)
+    if decode is None:
+        # Unknown format: best-effort interpretation from the buffer size
+        frame = frame.reshape((h, w, -1))
+        if frame.shape[2] == 1:
+            return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        return frame.copy()  # Don't hand out a view of the SDK buffer
+    return decode(frame, h, w, next_frame_buffer((h, w, 3)))
+
+# Pipeline: capture thread → capture_q → inference worker(s) → main loop (draw,
+# log, relay, publish). Capture runs in its own thread so grabbing/demosaicing the
+# next frames overlaps with inference on the current batch and drawing of the
+# previous one. The queue holds at most one batch and drops its oldest frame when
+# full, so a slow stage downstream never stalls capture and always gets fresh frames.
+capture_q = queue.Queue(maxsize=INFER_BATCH)
+capture_stop = threading.Event()
+# Cleared while the machine is stopped waiting for the resume signal, so capture
+# doesn't keep demosaicing frames that would only be thrown away
+capture_running = threading.Event()
+capture_running.set()
+dropped_frames = 0  # Captured frames discarded before inference (consumer fell behind)
+capture_error = None  # Exception that ended the capture thread, re-raised by the main loop
+results_cond = threading.Condition()  # Signals new entries in ready_batches (or capture_error)
+
+def capture_worker():
+    global dropped_frames, capture_error
+    pin_current_thread(CAPTURE_CPUS, nice=-10)
+    try:
+        while not capture_stop.is_set():
+            if not capture_running.wait(timeout=0.5):
+                continue
+            frame = grab_frame(1000)
+            if frame is None:
+                continue
+            if not capture_running.is_set():
+                release_frame_buffer(frame)  # Paused while this frame was being grabbed
+                continue
+            while True:
+                try:
+                    capture_q.put_nowait(frame)
+                    break
+                except queue.Full:
+                    try:
+                        release_frame_buffer(capture_q.get_nowait())
+                        dropped_frames += 1
+                    except queue.Empty:
+                        pass
+    except Exception as e:
+        # Hand it to the main loop so the process exits (and the container restarts)
+        # instead of waiting forever on frames that will never come
+        with results_cond:
+            capture_error = e
+            results_cond.notify_all()
+
+def drain_capture_queue():
+    """Drop (and recycle) frames captured before the machine stopped"""
+    while True:
+        try:
+            release_frame_buffer(capture_q.get_nowait())
+        except queue.Empty:
+            return
+
+capture_thread = threading.Thread(target=capture_worker, daemon=True)
+capture_thread.start()
+
+# =========================
+# INFERENCE WORKERS
+# =========================
+# One worker per engine context. A worker takes the next micro-batch off the
+# capture queue under batch_lock (so batches stay contiguous and are numbered in
+# capture order), infers it on its own engine and posts the result. The main loop
+# consumes results strictly by sequence number, so with several engines
+# successive batches infer in parallel while drawing/logging still sees frames in order.
+batch_lock = threading.Lock()
+next_batch_seq = 0
+resume_batch_seq = 0      # Batches numbered below this were captured before the last machine stop
+inflight_slots = threading.Semaphore(len(contexts))  # Bounds batches in flight while the loop is blocked
+ready_batches = {}        # seq → (frames, batch_dets or the exception the worker hit)
+
+def collect_batch():
+    """Take a micro-batch off the capture queue: the first frame waits up to 1 s,
+    the rest only until BATCH_WINDOW_MS after it so batching never adds more than that"""
+    try:
+        frames = [capture_q.get(timeout=1.0)]
+    except queue.Empty:
+        return None
+    batch_deadline = time.monotonic() + BATCH_WINDOW_MS / 1000.0
+    while len(frames) < INFER_BATCH:
+        remaining = batch_deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            frames.append(capture_q.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return frames
+
+def static_gate(frames):
+    """Indices of the frames that need inference.
+    Only clean results are ever reused, so a frame after a defect is always
+    re-inferred and relay logic only fires on real detections."""
+    global prev_digest, skipped_frames
+    if STATIC_DIFF_THRESHOLD <= 0:
+        return list(range(len(frames)))
+    infer_idx = []
+    for i, frame in enumerate(frames):
+        digest = cv2.resize(frame, (8, 8), interpolation=cv2.INTER_AREA).astype(np.int16)
+        if (prev_digest is not None and last_defect_count == 0
+                and np.abs(digest - prev_digest).sum() < STATIC_DIFF_THRESHOLD):
+            skipped_frames += 1
+        else:
+            prev_digest = digest
+            infer_idx.append(i)
+    return infer_idx
+
+# predict() arguments for the Ultralytics fallback path — fixed for the whole run
+PREDICT_KWARGS = {
+    "conf": CONF_THRESHOLD,
+    "iou": IOU_THRESHOLD,
+    "imgsz": IMG_SIZE,
+    "verbose": False,
+    "augment": False,
+    "max_det": MAX_DET,
+    "agnostic_nms": True,
+}
+# Only pass device/half for PyTorch models (not TensorRT engines)
+if not is_engine:
+    PREDICT_KWARGS["device"] = device
+    PREDICT_KWARGS["half"] = True
+
+def inference_worker(ctx):
+    global next_batch_seq
+    pin_current_thread(INFER_CPUS)
+    while not capture_stop.is_set():
+        if not inflight_slots.acquire(timeout=0.5):
+            continue
+        with batch_lock:
+            frames, infer_idx = [], None
+            try:
+                frames = collect_batch()
+                if frames is not None:
+                    infer_idx = static_gate(frames)
+            except Exception as e:
+                infer_idx = e  # Posted as this batch's result below
+            if frames is None:
+                inflight_slots.release()
+                continue
+            seq = next_batch_seq
+            next_batch_seq += 1
+
+        # Run YOLO detection. Any failure is posted in place of the detections; the
+        # main loop releases this batch's inflight slot when it takes it and re-raises
+        try:
+            if isinstance(infer_idx, Exception):
+                raise infer_idx
+            batch_dets = [NO_DETECTIONS] * len(frames)
+            if infer_idx:
+                inferred = infer_batch([frames[i] for i in infer_idx], PREDICT_KWARGS, ctx)
+                for i, dets in zip(infer_idx, inferred):
+                    batch_dets[i] = dets
+        except Exception as e:
+            batch_dets = e  # Re-raised by the main loop
+        with results_cond:
+            ready_batches[seq] = (frames, batch_dets)
+            results_cond.notify_all()
+
+def discard_stale_batches():
+    """After the machine resumes, drop frames captured while it was stopped"""
+    global resume_batch_seq
+    with batch_lock:
+        drain_capture_queue()
+        resume_batch_seq = next_batch_seq
+
+inference_threads = [threading.Thread(target=inference_worker, args=(ctx,), daemon=True)
+                     for ctx in contexts]
+for t in inference_threads:
+    t.start()
+
+def build_draw_list(dets):
+    """Split (N, 6) detections into int32 pixel boxes, confidences and class ids in one pass"""
+    return dets[:, :4].astype(np.int32), dets[:, 4], dets[:, 5].astype(np.int32)
+
+# Overlay text metrics without a cv2.getTextSize call per string per frame: box
+# labels repeat (class name + 2-decimal conf), so whole-string sizes are cached.
+# The stats lines change every render but that only happens at 1 Hz.
+_text_sizes = {}        # (text, scale, thickness) → (width, height) in pixels
+TEXT_SIZE_CACHE_MAX = 4096
+
+def text_size(text, scale, thickness):
+    """(width, height) of text in FONT_HERSHEY_SIMPLEX, from cv2.getTextSize (cached)"""
+    key = (text, scale, thickness)
+    size = _text_sizes.get(key)
+    if size is None:
+        if len(_text_sizes) >= TEXT_SIZE_CACHE_MAX:
+            _text_sizes.clear()
+        size = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)[0]
+        _text_sizes[key] = size
+    return size
+
+def render_stats_overlay(lines, color):
+    """Render the stats lines as opaque patches (black box + text) to be pasted per frame"""
+    patches = []
+    y = 30
+    for text in lines:
+        w, _ = text_size(text, 0.7, 2)
+        # Same footprint as the filled rectangle (10, y-25)-(20+w, y+5), text at (15, y)
+        patch = np.zeros((31, 11 + w, 3), dtype=np.uint8)
+        cv2.putText(patch, text, (5, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+        patches.append((y - 25, 10, patch))
+        y += 35
+    return patches
+
 # Create display window if display available
 if HAS_DISPLAY:
     cv2.namedWindow("Fabric Defect Detection - Live Feed", cv2.WINDOW_NORMAL)
@@ -636,186 +1392,195 @@ if HAS_DISPLAY:
 # MAIN LOOP
 # =========================
 # Flow: Detect continuously → defect found → relay ON 2s (background) + wait Pin 33 HIGH → resume detection
+quit_requested = False
+expected_seq = 0
+
+def request_quit(signum, _frame):
+    """SIGTERM (docker stop): finish the current batch and run the normal cleanup"""
+    global quit_requested
+    print(f"\nReceived signal {signum} — stopping...")
+    quit_requested = True
+
+signal.signal(signal.SIGTERM, request_quit)
+pin_current_thread(POST_CPUS)  # Relay pulse threads started from here inherit it
 try:
-    while True:
+    while not quit_requested:
         set_relay_status("DETECTING")
-        loop_start = time.time()
+        loop_start = time.monotonic()
 
-        # Get image from camera
-        ret = cam.MV_CC_GetImageBuffer(stOutFrame, 1000)
-        if ret != 0:
+        # Next inferred batch, in capture order
+        with results_cond:
+            if not results_cond.wait_for(lambda: expected_seq in ready_batches or capture_error,
+                                         timeout=1.0):
+                continue
+            if expected_seq not in ready_batches:
+                raise capture_error
+            frames, batch_dets = ready_batches.pop(expected_seq)
+        inflight_slots.release()
+        expected_seq += 1
+        if isinstance(batch_dets, Exception):
+            raise batch_dets
+        if expected_seq <= resume_batch_seq:
+            # Captured before the machine stopped — already stale
+            for frame in frames:
+                release_frame_buffer(frame)
             continue
 
-        # Convert image data to numpy array
-        frame_info = stOutFrame.stFrameInfo
-        
-        frame = np.ctypeslib.as_array(
-            cast(stOutFrame.pBufAddr, POINTER(c_ubyte)),
-            shape=(frame_info.nFrameLen,)
-        ).copy()
-        
-        # Reshape based on pixel format
-        if frame_info.enPixelType == PixelType_Gvsp_Mono8:
-            frame = frame.reshape((frame_info.nHeight, frame_info.nWidth))
-            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
-        elif frame_info.enPixelType == PixelType_Gvsp_RGB8_Packed:
-            frame = frame.reshape((frame_info.nHeight, frame_info.nWidth, 3))
-            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-        elif frame_info.enPixelType in [PixelType_Gvsp_BayerGR8, PixelType_Gvsp_BayerRG8, 
-                                         PixelType_Gvsp_BayerGB8, PixelType_Gvsp_BayerBG8]:
-            frame = frame.reshape((frame_info.nHeight, frame_info.nWidth))
-            frame = cv2.cvtColor(frame, cv2.COLOR_BayerBG2BGR)
-        else:
-            frame = frame.reshape((frame_info.nHeight, frame_info.nWidth, -1))
-            if frame.shape[2] == 1:
-                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
-
-        # Release image buffer immediately
-        cam.MV_CC_FreeImageBuffer(stOutFrame)
-
-        frame_count += 1
-        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
-
-        # Run YOLO detection
-        predict_kwargs = {
-            "conf": CONF_THRESHOLD,
-            "iou": IOU_THRESHOLD,
-            "imgsz": IMG_SIZE,
-            "verbose": False,
-            "augment": False,
-            "max_det": 50,
-            "agnostic_nms": True,
-        }
-
-        # Only pass device/half for PyTorch models (not TensorRT engines)
-        if not is_engine:
-            predict_kwargs["device"] = device
-            predict_kwargs["half"] = True
-
-        results = model.predict(frame, **predict_kwargs)[0]
-
-        boxes = results.boxes
-        defect_count = len(boxes)
-
-        # Create display frame
-        display_frame = frame.copy()
-
-        # Process detections
-        if defect_count > 0:
-            defect_frame_count += 1
-            time_str = time.strftime("%H:%M:%S")
+        resumed_in_batch = False
+        for batch_pos, (frame, dets) in enumerate(zip(frames, batch_dets)):
+            if resumed_in_batch:
+                break  # Remaining frames of this batch predate the machine stop
+            frame_count += 1
+            defect_count = len(dets)
+            last_defect_count = defect_count
+
+            # Draw straight onto the captured frame: inference is done with it, the
+            # buffer is only recycled after this iteration, and save/web/imshow take
+            # their own copies
+            display_frame = frame
+
+            # Process detections
+            if defect_count > 0:
+                defect_frame_count += 1
+                # Timestamps are only needed for defect frames — format them here, not every frame
+                now = datetime.now()
+                defect_time = now.timestamp()
+                time_str = now.strftime("%H:%M:%S")
+                timestamp_str = now.strftime("%Y%m%d_%H%M%S_") + f"{now.microsecond // 1000:03d}"
             
-            print(f"\n{'='*60}")
-            print(f"  DEFECT DETECTED | Frame #{frame_count} | {time_str}")
-            print(f"  Defects in frame: {defect_count}")
-            print(f"{'='*60}")
+                print(f"\n{'='*60}")
+                print(f"  DEFECT DETECTED | Frame #{frame_count} | {time_str}")
+                print(f"  Defects in frame: {defect_count}")
+                print(f"{'='*60}")
             
-            for idx, box in enumerate(boxes):
-                cls = int(box.cls[0])
-                conf = float(box.conf[0])
-                class_name = model.names[cls]
-                x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
-
-                print(f"  [{idx+1}] Class: {class_name} | Confidence: {conf:.2f} | BBox: ({x1},{y1})-({x2},{y2})")
-
-                defect_log.append({
-                    "time": time_str,
-                    "frame": frame_count,
-                    "class": class_name,
-                    "confidence": f"{conf:.2f}",
-                    "bbox": f"({x1},{y1})-({x2},{y2})"
-                })
-
-                # Draw bounding box
-                cv2.rectangle(display_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                boxes, confs, classes = build_draw_list(dets)
+                log_defects(defect_time, frame_count, boxes, confs, classes)
+                for idx, ((x1, y1, x2, y2), conf, class_name) in enumerate(
+                        zip(boxes.tolist(), confs.tolist(), [CLASS_NAMES[c] for c in classes.tolist()])):
+
+                    print(f"  [{idx+1}] Class: {class_name} | Confidence: {conf:.2f} | BBox: ({x1},{y1})-({x2},{y2})")
+
+                    # Draw bounding box
+                    cv2.rectangle(display_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
                 
-                # Draw label
-                label = f"{class_name} {conf:.2f}"
-                label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-                cv2.rectangle(display_frame, (x1, y1 - label_size[1] - 10), 
-                            (x1 + label_size[0], y1), (0, 255, 0), -1)
-                cv2.putText(display_frame, label, (x1, y1 - 5),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
-
-            # ── DEFECT ACTIONS (two parallel branches) ──
-            # Branch 1: Relay ON for 2 seconds then OFF (background thread)
-            print(f"  >> PULSING RELAY — ON for {RELAY_ON_DURATION}s (background)...")
-            relay_thread = threading.Thread(target=pulse_relay, daemon=True)
-            relay_thread.start()
-
-            # Update web stream with defect info
-            if ENABLE_WEB:
-                with frame_lock:
-                    latest_frame = display_frame.copy()
-                with stats_lock:
+                    # Draw label
+                    label = f"{class_name} {conf:.2f}"
+                    label_size = text_size(label, 0.5, 2)
+                    cv2.rectangle(display_frame, (x1, y1 - label_size[1] - 10), 
+                                (x1 + label_size[0], y1), (0, 255, 0), -1)
+                    cv2.putText(display_frame, label, (x1, y1 - 5),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+
+                # Save ONLY defect frames (written by the background saver)
+                frame_path = f"{RESULTS_PREFIX}{defect_frame_count:06d}_{timestamp_str}.jpg"
+                queue_frame_save(frame_path, display_frame)
+                print(f"  Queued save: {frame_path}")
+                print(f"  Total defect frames saved: {defect_frame_count}")
+
+                # ── DEFECT ACTIONS (two parallel branches) ──
+                # Branch 1: Relay ON for 2 seconds then OFF (background thread)
+                print(f"  >> PULSING RELAY — ON for {RELAY_ON_DURATION}s (background)...")
+                relay_thread = threading.Thread(target=pulse_relay, daemon=True)
+                relay_thread.start()
+
+                # Update web stream with defect info
+                if ENABLE_WEB:
+                    publish_web_frame(display_frame)
                     live_stats["relay_status"] = "DEFECT_STOP"
                     live_stats["current_defects"] = defect_count
-
-            # Branch 2: Wait for HIGH signal on Pin 33 to resume detection
-            print(f"  >> WAITING for HIGH signal on Pin {TRIGGER_PIN} to resume detection...")
-            wait_for_resume_signal()
-            ts_resume = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-            print(f"  [{ts_resume}] Resume signal received — detection RESUMED!")
-            set_relay_status("DETECTING")
-
-        # Calculate FPS
-        loop_time = time.time() - loop_start
-        actual_fps = 1.0 / loop_time if loop_time > 0 else 0
-        fps_queue.append(actual_fps)
-        avg_fps = sum(fps_queue) / len(fps_queue)
-
-        # Display (if available)
-        # Add stats overlay (for both display and web stream)
-        current_time = time.time()
-        stats = [
-            f"FPS: {avg_fps:.1f}",
-            f"Frame: {frame_count}",
-            f"Defects: {defect_count}",
-            f"Total Defects: {len(defect_log)}",
-            f"Saved: {defect_frame_count}"
-        ]
-        y = 30
-        for text in stats:
-            ts, _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
-            cv2.rectangle(display_frame, (10, y - 25), (20 + ts[0], y + 5), (0, 0, 0), -1)
-            color = (0, 255, 0) if defect_count > 0 else (255, 255, 255)
-            cv2.putText(display_frame, text, (15, y),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-            y += 35
-
-        if HAS_DISPLAY:
-            if current_time - last_display_time >= DISPLAY_INTERVAL:
+                    publish_stats()
+
+                # Branch 2: Wait for HIGH signal on Pin 33 to resume detection
+                print(f"  >> WAITING for HIGH signal on Pin {TRIGGER_PIN} to resume detection...")
+                capture_running.clear()
+                wait_for_resume_signal()
+                if quit_requested:
+                    break  # Stopped while waiting — go straight to cleanup
+                ts_resume = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+                print(f"  [{ts_resume}] Resume signal received — detection RESUMED!")
+                set_relay_status("DETECTING")
+                discard_stale_batches()
+                capture_running.set()
+                resumed_in_batch = True
+
+            # Calculate FPS (average per-frame time of the batch so far); one clock
+            # read per frame, reused for the display throttle and uptime below
+            current_time = time.monotonic()
+            loop_time = (current_time - loop_start) / (batch_pos + 1)
+            actual_fps = 1.0 / loop_time if loop_time > 0 else 0
+            avg_fps = actual_fps if avg_fps == 0 else FPS_EMA_ALPHA * actual_fps + (1 - FPS_EMA_ALPHA) * avg_fps
+
+            # Only frames somebody will look at get the stats overlay: the local window
+            # (when it is due for a refresh) or an open web stream. Defect boxes are
+            # always drawn above since the saved frame needs them.
+            show_now = HAS_DISPLAY and current_time - last_display_time >= DISPLAY_INTERVAL
+            stream_now = (ENABLE_WEB and mjpeg_clients > 0
+                          and (WEB_FPS <= 0 or current_time - last_web_publish_time >= 1.0 / WEB_FPS))
+
+            # Add stats overlay (for both display and web stream). The text is
+            # re-rendered at 1 Hz (or when the defect count changes); in between the
+            # cached patches are just pasted onto the frame.
+            if show_now or stream_now:
+                if (current_time - last_overlay_time >= STATS_OVERLAY_INTERVAL
+                        or defect_count != overlay_defects):
+                    stats = [
+                        f"FPS: {avg_fps:.1f}",
+                        f"Frame: {frame_count}",
+                        f"Defects: {defect_count}",
+                        f"Total Defects: {defect_total}",
+                        f"Saved: {defect_frame_count}"
+                    ]
+                    color = (0, 255, 0) if defect_count > 0 else (255, 255, 255)
+                    stats_overlay = render_stats_overlay(stats, color)
+                    last_overlay_time = current_time
+                    overlay_defects = defect_count
+                for row, col, patch in stats_overlay:
+                    region = display_frame[row:row + patch.shape[0], col:col + patch.shape[1]]
+                    region[...] = patch[:region.shape[0], :region.shape[1]]
+
+            # waitKey (GUI event pump + 'q' check) only on frames that were actually shown
+            if show_now:
                 cv2.imshow("Fabric Defect Detection - Live Feed", display_frame)
                 last_display_time = current_time
 
-            key = cv2.waitKey(1) & 0xFF
-            if key == ord('q'):
-                print("\nQuitting (pressed 'q')...")
-                break
-
-        # Update web stream frame and stats
-        if ENABLE_WEB:
-            with frame_lock:
-                latest_frame = display_frame.copy()
-            with stats_lock:
-                live_stats["fps"] = avg_fps
-                live_stats["frame_count"] = frame_count
-                live_stats["current_defects"] = defect_count
-                live_stats["total_defects"] = len(defect_log)
-                live_stats["defect_frames_saved"] = defect_frame_count
-                live_stats["uptime"] = time.time() - start_time
-                live_stats["model"] = MODEL_PATH
-                live_stats["camera_ip"] = TARGET_CAMERA_IP
-                live_stats["relay_enabled"] = RELAY_ENABLED
-                live_stats["relay_status"] = get_relay_status()
-                live_stats["relay_pin"] = RELAY_PIN
-                live_stats["trigger_pin"] = TRIGGER_PIN
-                live_stats["relay_on_duration"] = RELAY_ON_DURATION
-
-        # Console status
-        if frame_count % 30 == 0:
-            print(f"Frame {frame_count:06d} | FPS: {avg_fps:.1f} | "
-                  f"Defects: {defect_count} | Saved: {defect_frame_count}")
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord('q'):
+                    print("\nQuitting (pressed 'q')...")
+                    quit_requested = True
+                    break
+
+            # Update web stream frame and stats
+            if ENABLE_WEB:
+                if stream_now:
+                    publish_web_frame(display_frame)
+                    last_web_publish_time = current_time
+                relay_state = get_relay_status()
+                if (frame_count % STATS_EVERY_N_FRAMES == 0
+                        or defect_count != live_stats["current_defects"]
+                        or relay_state != live_stats["relay_status"]):
+                    live_stats["fps"] = avg_fps
+                    live_stats["frame_count"] = frame_count
+                    live_stats["current_defects"] = defect_count
+                    live_stats["total_defects"] = defect_total
+                    live_stats["defect_frames_saved"] = defect_frame_count
+                    live_stats["uptime"] = current_time - start_time
+                    live_stats["model"] = MODEL_PATH
+                    live_stats["camera_ip"] = TARGET_CAMERA_IP
+                    live_stats["relay_enabled"] = RELAY_ENABLED
+                    live_stats["relay_status"] = relay_state
+                    live_stats["relay_pin"] = RELAY_PIN
+                    live_stats["trigger_pin"] = TRIGGER_PIN
+                    live_stats["relay_on_duration"] = RELAY_ON_DURATION
+                    publish_stats()
+
+            # Console status
+            if frame_count % 30 == 0:
+                print(f"Frame {frame_count:06d} | FPS: {avg_fps:.1f} | "
+                      f"Defects: {defect_count} | Saved: {defect_frame_count}")
+
+        # Every frame of the batch has been copied out (display/web/save) — hand back the buffers
+        for frame in frames:
+            release_frame_buffer(frame)
 
 except KeyboardInterrupt:
     print("\nInterrupted by user (Ctrl+C)")
@@ -824,6 +1589,13 @@ except KeyboardInterrupt:
 # CLEANUP
 # =========================
 print("\nCleaning up...")
+if save_q.unfinished_tasks:
+    print(f"  Writing {save_q.unfinished_tasks} pending defect frame(s)...")
+save_q.join()
+capture_stop.set()
+capture_thread.join(timeout=2.0)
+for t in inference_threads:
+    t.join(timeout=2.0)
 if RELAY_ENABLED and GPIO:
     try:
         GPIO.output(RELAY_PIN, GPIO.HIGH)  # Relay OFF
@@ -838,7 +1610,7 @@ cam.MV_CC_CloseDevice()
 cam.MV_CC_DestroyHandle()
 MvCamera.MV_CC_Finalize()
 
-total_time = time.time() - start_time
+total_time = time.monotonic() - start_time
 
 print()
 print("=" * 70)
@@ -847,19 +1619,29 @@ print("=" * 70)
 print(f"  Total Frames Processed:    {frame_count}")
 print(f"  Defect Frames Saved:       {defect_frame_count}")
 print(f"  Clean Frames (not saved):  {frame_count - defect_frame_count}")
-print(f"  Total Defects Detected:    {len(defect_log)}")
+if STATIC_DIFF_THRESHOLD > 0:
+    print(f"  Static Frames (skipped):   {skipped_frames}")
+print(f"  Dropped Frames:            {dropped_frames}")
+print(f"  Total Defects Detected:    {defect_total}")
 print(f"  Runtime:                   {total_time:.2f} seconds")
 print(f"  Average FPS:               {frame_count / total_time:.2f}" if total_time > 0 else "  Average FPS: N/A")
 print(f"  Save Location:             {RESULTS_FOLDER}")
 print("=" * 70)
 
 # Save defect log to CSV
-if defect_log:
+if defect_total:
     import csv
-    log_path = os.path.join(RESULTS_FOLDER, f"defect_log_{time.strftime('%Y%m%d_%H%M%S')}.csv")
+    log_path = f"{LOG_PREFIX}{time.strftime('%Y%m%d_%H%M%S')}.csv"
     with open(log_path, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=defect_log[0].keys())
-        writer.writeheader()
-        writer.writerows(defect_log)
+        writer = csv.writer(f)
+        writer.writerow(["time", "frame", "class", "confidence", "bbox"])
+        n = defect_total
+        writer.writerows(
+            (time.strftime("%H:%M:%S", time.localtime(t)), frame_no, CLASS_NAMES[cls],
+             f"{conf:.2f}", f"({x1},{y1})-({x2},{y2})")
+            for t, frame_no, cls, conf, (x1, y1, x2, y2) in zip(
+                defect_log["time"][:n].tolist(), defect_log["frame"][:n].tolist(),
+                defect_log["class"][:n].tolist(), defect_log["confidence"][:n].tolist(),
+                defect_log["bbox"][:n].tolist()))
     print(f"  Defect log: {log_path}")
     print("=" * 70)
@@ -6,26 +6,79 @@ The .engine file is NOT portable — it must be built on the target device.
 
 Usage:
     python /app/export_tensorrt.py
+
+INT8 + DLA build (needs a calibration dataset YAML of representative fabric frames):
+    EXPORT_PRECISION=int8 CALIB_DATA=/app/model/calib.yaml DLA_CORE=0 python /app/export_tensorrt.py
+
+Or point CALIB_IMAGES at a plain folder of 300-500 frames and the YAML is generated:
+    EXPORT_PRECISION=int8 CALIB_IMAGES=/app/model/calib_images DLA_CORE=0 python /app/export_tensorrt.py
+
+Add VAL_DATA=/app/model/data.yaml (a labelled set) to validate the built engine.
 """
 
 import os
+import yaml
 from ultralytics import YOLO
 
 MODEL_DIR = "/app/model"
 PT_MODEL = os.path.join(MODEL_DIR, "best.pt")
 IMG_SIZE = int(os.environ.get("IMG_SIZE", "416"))
+# Bake NMS into the engine (EfficientNMS-style end-to-end output) so inference
+# returns already-filtered boxes instead of raw anchors
+EXPORT_NMS = os.environ.get("EXPORT_NMS", "true").lower() in ("true", "1", "yes")
+# Embedded NMS is frozen into the engine, so it takes the detector's thresholds
+# (same env vars as defect_detection.py) — the detector only re-filters on confidence
+CONF_THRESHOLD = float(os.environ.get("CONF_THRESHOLD", "0.20"))
+IOU_THRESHOLD = float(os.environ.get("IOU_THRESHOLD", "0.20"))
+MAX_DET = 50
+# Precision: fp16 (default) or int8 (PTQ calibrated on CALIB_DATA, FP16 fallback per layer)
+EXPORT_PRECISION = os.environ.get("EXPORT_PRECISION", "fp16").lower()
+CALIB_DATA = os.environ.get("CALIB_DATA", "")
+# Folder of calibration frames (no labels needed); used to write CALIB_DATA when it is unset
+CALIB_IMAGES = os.environ.get("CALIB_IMAGES", "")
+# Validate the built engine on a labelled dataset YAML (e.g. the calibration set
+# with labels) to check the INT8 accuracy drop; empty = skip
+VAL_DATA = os.environ.get("VAL_DATA", "")
+# Target a DLA core ("0" or "1") for the backbone; unsupported layers fall back to GPU
+DLA_CORE = os.environ.get("DLA_CORE", "")
+
+IS_INT8 = EXPORT_PRECISION == "int8"
+# Max batch for a dynamic-batch engine (1 = static batch-1 engine); the detector's
+# INFER_BATCH must not exceed this
+EXPORT_BATCH = int(os.environ.get("EXPORT_BATCH", "1"))
+
+ENGINE_SUFFIX = ("_int8" if IS_INT8 else "") + (f"_dla{DLA_CORE}" if DLA_CORE else "")
 
 if not os.path.exists(PT_MODEL):
     print(f"ERROR: {PT_MODEL} not found!")
     print(f"Please place your best.pt model in the ./model/ directory")
     exit(1)
 
+AUTO_CALIB = IS_INT8 and not CALIB_DATA and bool(CALIB_IMAGES)
+if AUTO_CALIB:
+    if not os.path.isdir(CALIB_IMAGES):
+        print(f"ERROR: CALIB_IMAGES={CALIB_IMAGES} is not a directory")
+        exit(1)
+    CALIB_DATA = os.path.join(MODEL_DIR, "calib_auto.yaml")
+
+if IS_INT8 and not AUTO_CALIB and not os.path.exists(CALIB_DATA):
+    print(f"ERROR: INT8 export needs a calibration dataset YAML (CALIB_DATA={CALIB_DATA or 'unset'})")
+    print("Point CALIB_DATA at a dataset YAML, or CALIB_IMAGES at a folder, with ~500 representative fabric frames")
+    exit(1)
+
 print("=" * 60)
 print("  TensorRT Export — Jetson Orin Nano")
 print("=" * 60)
 print(f"  Source:   {PT_MODEL}")
 print(f"  ImgSize:  {IMG_SIZE}")
-print(f"  Format:   TensorRT FP16")
+print(f"  Format:   TensorRT {'INT8 (FP16 fallback)' if IS_INT8 else 'FP16'}")
+if IS_INT8:
+    print(f"  Calib:    {CALIB_IMAGES + ' (auto YAML)' if AUTO_CALIB else CALIB_DATA}")
+print(f"  Batch:    {'dynamic, max ' + str(EXPORT_BATCH) if EXPORT_BATCH > 1 else '1 (static)'}")
+print(f"  Device:   {'DLA core ' + DLA_CORE + ' (GPU fallback)' if DLA_CORE else 'GPU'}")
+print(f"  NMS:      {'embedded in engine' if EXPORT_NMS else 'runtime (Ultralytics)'}")
+if EXPORT_NMS:
+    print(f"            conf {CONF_THRESHOLD}, iou {IOU_THRESHOLD}, agnostic, max_det {MAX_DET}")
 print("=" * 60)
 print()
 print("This will take 5-15 minutes...")
@@ -44,17 +97,49 @@ print()
 
 model = YOLO(PT_MODEL)
 
-model.export(
-    format="engine",        # TensorRT
-    imgsz=IMG_SIZE,         # Must match inference size
-    half=True,              # FP16 — supported on Orin (Ampere arch)
-    device=0,               # Use GPU
-    workspace=1,            # GB — keep LOW to avoid OOM on 8GB Jetson
-    simplify=True,          # ONNX simplification before conversion
-    batch=1,                # Single batch to reduce memory
-)
-
-engine_path = PT_MODEL.replace(".pt", ".engine")
+if AUTO_CALIB:
+    # Minimal dataset YAML: TensorRT only reads the images of the val split for calibration
+    n_images = sum(1 for f in os.listdir(CALIB_IMAGES)
+                   if f.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")))
+    # safe_dump quotes class names that YAML would misread (":", "#", yes/no, ...)
+    with open(CALIB_DATA, "w") as f:
+        yaml.safe_dump({"path": os.path.abspath(CALIB_IMAGES), "train": ".", "val": ".",
+                        "names": dict(model.names)}, f, sort_keys=False)
+    print(f"  Calib YAML: {CALIB_DATA} ({n_images} images from {CALIB_IMAGES})")
+    print()
+
+# Ultralytics always writes <model>.engine, so an INT8/DLA build would overwrite the
+# FP16 engine before it gets renamed — park the FP16 engine until the export is done
+export_path = PT_MODEL.replace(".pt", ".engine")
+engine_path = PT_MODEL.replace(".pt", f"{ENGINE_SUFFIX}.engine")
+parked_path = export_path + ".fp16" if ENGINE_SUFFIX and os.path.exists(export_path) else None
+if parked_path:
+    os.replace(export_path, parked_path)
+
+try:
+    model.export(
+        format="engine",        # TensorRT
+        imgsz=IMG_SIZE,         # Must match inference size
+        half=True,              # FP16 — supported on Orin (Ampere arch)
+        int8=IS_INT8,           # INT8 PTQ — calibrated on CALIB_DATA
+        data=CALIB_DATA if IS_INT8 else None,
+        device=f"dla:{DLA_CORE}" if DLA_CORE else 0,  # DLA core or GPU
+        workspace=1,            # GB — keep LOW to avoid OOM on 8GB Jetson
+        simplify=True,          # ONNX simplification before conversion
+        batch=EXPORT_BATCH,     # Max batch (1 = single batch to reduce memory)
+        dynamic=EXPORT_BATCH > 1,  # Dynamic batch profile for micro-batched inference
+        nms=EXPORT_NMS,         # End-to-end NMS inside the engine
+        conf=CONF_THRESHOLD,    # Baked-in NMS thresholds — must match the detector
+        iou=IOU_THRESHOLD,
+        agnostic_nms=True,
+        max_det=MAX_DET,
+    )
+    if ENGINE_SUFFIX and os.path.exists(export_path):
+        # Keep the FP16 GPU engine and the INT8/DLA build side by side
+        os.replace(export_path, engine_path)
+finally:
+    if parked_path:
+        os.replace(parked_path, export_path)
 if os.path.exists(engine_path):
     size_mb = os.path.getsize(engine_path) / (1024 * 1024)
     print()
@@ -62,7 +147,19 @@ if os.path.exists(engine_path):
     print(f"  ✓ SUCCESS! TensorRT engine created")
     print(f"  Path: {engine_path}")
     print(f"  Size: {size_mb:.1f} MB")
+    print(f"  Use:  MODEL_PATH={engine_path}")
     print("=" * 60)
+
+    if VAL_DATA:
+        print()
+        print(f"Validating engine on {VAL_DATA}...")
+        del model
+        gc.collect()
+        torch.cuda.empty_cache()
+        metrics = YOLO(engine_path, task="detect").val(data=VAL_DATA, imgsz=IMG_SIZE, batch=1,
+                                                        device=f"dla:{DLA_CORE}" if DLA_CORE else 0)
+        print(f"  mAP50:    {metrics.box.map50:.3f}")
+        print(f"  mAP50-95: {metrics.box.map:.3f}")
 else:
     print("WARNING: Engine file not found at expected path.")
     print("Check the output above for the actual path.")